@@ -4,16 +4,32 @@ Modem Connection Rotator Service
 A simple HTTP service to rotate modem connections on Raspberry Pi
 """
 
+import atexit
+import ctypes
+import errno
 import json
 import logging
+import logging.handlers
+import queue
+import select
+import socket
+import struct
 import subprocess
 import time
+import types
 from datetime import datetime
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from threading import Lock
 from typing import Dict, Any
 import os
 
+# orjson encodes straight to bytes in native code; fall back to stdlib
+# json so a plain copy-to-the-Pi deployment still works without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Configuration
 CONFIG = {
     "port": 8080,
@@ -21,7 +37,11 @@ CONFIG = {
     "disconnect_delay": 1,
     "reconnect_timeout": 8,
     "log_level": "INFO",
-    "modem_reset_delay": 1
+    "modem_reset_delay": 1,
+    "aggressive_rotation": False,
+    "probe_method": "tcp",
+    "probe_timeout": 1,
+    "status_ttl": 0.5
 }
 
 # Load config from file if it exists
@@ -34,358 +54,650 @@ if os.path.exists(CONFIG_FILE):
     except Exception as e:
         print(f"Warning: Could not load config file: {e}")
 
-# Setup logging
+# Config is immutable after startup; freeze it so hot paths do attribute
+# access instead of dict lookups
+CFG = types.SimpleNamespace(**CONFIG)
+
+# Setup logging. Records are enqueued from the request path and written
+# by a background listener thread, so a slow SD card never blocks a
+# request or the rotation sequence on log I/O.
+_log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+_log_file_handler = logging.FileHandler('rotator.log')
+_log_file_handler.setFormatter(_log_formatter)
+_log_stream_handler = logging.StreamHandler()
+_log_stream_handler.setFormatter(_log_formatter)
+_log_queue = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(
+    _log_queue, _log_file_handler, _log_stream_handler
+)
+_log_listener.start()
+
+def _stop_log_listener():
+    """Flush and stop the log listener; safe to call more than once"""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+atexit.register(_stop_log_listener)
+
+# The queue handler only merges arguments into the message; the
+# asctime/level prefix is applied by the listener's handlers.
+_log_queue_handler = logging.handlers.QueueHandler(_log_queue)
+_log_queue_handler.setFormatter(logging.Formatter('%(message)s'))
+
 logging.basicConfig(
-    level=getattr(logging, CONFIG["log_level"]),
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('rotator.log'),
-        logging.StreamHandler()
-    ]
+    level=getattr(logging, CFG.log_level),
+    handlers=[_log_queue_handler]
 )
 logger = logging.getLogger(__name__)
 
+# Only these probe methods are implemented; anything else (including
+# 'icmp', which a raw-socket probe never materialized for) would silently
+# behave like tcp, so flag it once at startup
+if CFG.probe_method not in ('tcp', 'ping'):
+    logger.warning(
+        "Unsupported probe_method %r (supported: tcp, ping); using tcp",
+        CFG.probe_method
+    )
+    CFG.probe_method = 'tcp'
+
+# rtnetlink constants not exposed by the socket module (see netlink(7))
+NETLINK_ROUTE = 0
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+RTM_NEWLINK = 16
+RTM_NEWADDR = 20
+RTM_NEWROUTE = 24
+RTM_GETADDR = 22
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+IFA_LOCAL = 2
+NLMSG_HDR_LEN = 16
+IFADDRMSG_LEN = 8
+
+# inotify constants (see inotify(7))
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CREATE = 0x100
+
+# USB vendor:product IDs recognized as cellular modems
+# (SimTech SIM7600 variants, Qualcomm). Extendable via "modem_ids" in config.json.
+KNOWN_MODEM_IDS = {(b'1e0e', b'9001'), (b'1e0e', b'9011'), (b'05c6', b'9025')}
+for _modem_id in getattr(CFG, 'modem_ids', []):
+    try:
+        _vendor, _product = _modem_id.lower().split(':')
+        KNOWN_MODEM_IDS.add((_vendor.encode(), _product.encode()))
+    except ValueError:
+        print(f"Warning: invalid modem_ids entry: {_modem_id}")
+
+# ctypes bindings for getifaddrs(3) so we can read interface addresses
+# without forking 'ip addr show'
+_libc = ctypes.CDLL('libc.so.6', use_errno=True)
+
+class _sockaddr_in(ctypes.Structure):
+    _fields_ = [
+        ('sin_family', ctypes.c_ushort),
+        ('sin_port', ctypes.c_uint16),
+        ('sin_addr', ctypes.c_uint8 * 4),
+    ]
+
+class _ifaddrs(ctypes.Structure):
+    pass
+
+_ifaddrs._fields_ = [
+    ('ifa_next', ctypes.POINTER(_ifaddrs)),
+    ('ifa_name', ctypes.c_char_p),
+    ('ifa_flags', ctypes.c_uint),
+    ('ifa_addr', ctypes.POINTER(_sockaddr_in)),
+]
+
+def get_ipv4_address(interface: str) -> str:
+    """Get the interface's IPv4 address via getifaddrs, or None"""
+    addrs = ctypes.POINTER(_ifaddrs)()
+    if _libc.getifaddrs(ctypes.byref(addrs)) != 0:
+        return None
+    try:
+        interface_bytes = interface.encode()
+        entry = addrs
+        while entry:
+            ifa = entry.contents
+            if ifa.ifa_name == interface_bytes and ifa.ifa_addr:
+                sa = ifa.ifa_addr.contents
+                if sa.sin_family == socket.AF_INET:
+                    ip = socket.inet_ntoa(bytes(sa.sin_addr))
+                    if not ip.startswith('127.'):
+                        return ip
+            entry = ifa.ifa_next
+        return None
+    finally:
+        _libc.freeifaddrs(addrs)
+
+def _read_sysfs(path: str) -> bytes:
+    """Read a small sysfs attribute with raw syscalls.
+
+    open().read() drags in the whole TextIOWrapper stack (fstat, ioctl,
+    seeks) for a file that is at most a few bytes; a bare open/read/close
+    is all these attributes need."""
+    fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+    try:
+        return os.read(fd, 16).strip()
+    finally:
+        os.close(fd)
+
+# Wall-clock timestamp cache: datetime.now().isoformat() allocates a
+# datetime and formats a fresh string per call, which adds up when /health
+# is scraped frequently; one-second granularity is plenty for display.
+_last_ts_sec = 0
+_last_ts_str = ''
+
+def isoformat_now() -> str:
+    """Current wall-clock time as an ISO string, cached per second"""
+    global _last_ts_sec, _last_ts_str
+    now = int(time.time())
+    if now != _last_ts_sec:
+        _last_ts_str = datetime.fromtimestamp(now).isoformat()
+        _last_ts_sec = now
+    return _last_ts_str
+
+def _run(argv, timeout, **kwargs):
+    """Run an external command.
+
+    Callers pass an absolute argv[0] and fd closing stays disabled so
+    CPython's subprocess module can spawn via posix_spawn instead of
+    forking the whole Python heap."""
+    return subprocess.run(argv, timeout=timeout, close_fds=False, **kwargs)
+
+def interface_is_up(interface: str) -> bool:
+    """Check interface up-state from sysfs operstate"""
+    try:
+        with open(f'/sys/class/net/{interface}/operstate') as f:
+            return f.read().strip() == 'up'
+    except OSError:
+        return False
+
 class ModemRotator:
     def __init__(self):
         self.lock = Lock()
         self.last_rotation = None
         self.rotation_count = 0
-    
+        # Cached (vendor_product, device_path, auth_fd) for the modem.
+        # Discovery walks lsusb + sysfs which is expensive; the bus address
+        # doesn't change between rotations so we only do it once.
+        self._usb_cache = None
+        # (timestamp, result) of the last internet reachability probe
+        self._probe_cache = (0.0, False)
+        # Memoized status snapshot, refreshed at most every 500 ms
+        self._status_cache = None
+        self._status_cache_at = 0.0
+        # Persistent request/response netlink socket for address dumps
+        self._nl_sock = None
+        self._nl_seq = 0
+        self._nl_lock = Lock()
+
+    def _probe_once(self) -> bool:
+        """Run one reachability probe according to CFG.probe_method"""
+        if CFG.probe_method == 'ping':
+            # Legacy method for networks that filter TCP to 8.8.8.8:53
+            try:
+                # Only the exit status matters; don't allocate pipes
+                result = _run(
+                    ['/usr/bin/ping', '-c', '1', '-W', '3', '8.8.8.8'],
+                    5, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+                )
+                return result.returncode == 0
+            except (OSError, subprocess.SubprocessError):
+                return False
+        try:
+            s = socket.create_connection(("8.8.8.8", 53), timeout=CFG.probe_timeout)
+            s.close()
+            return True
+        except OSError:
+            return False
+
+    def _probe_internet(self, fresh: bool = False) -> bool:
+        """Test internet reachability (TCP connect to 8.8.8.8:53 by default).
+
+        The result is cached for 500 ms so repeated status checks during
+        the rotate wait loop don't each fire a new probe; fresh=True
+        skips the cache and always probes."""
+        if not fresh:
+            cached_at, cached = self._probe_cache
+            if time.monotonic() - cached_at < 0.5:
+                return cached
+        result = self._probe_once()
+        self._probe_cache = (time.monotonic(), result)
+        return result
+
+    def _find_modem_id_via_sysfs(self) -> str:
+        """Find the modem's vendor:product ID by scanning sysfs"""
+        try:
+            for entry in os.scandir('/sys/bus/usb/devices'):
+                name = entry.name
+                if ':' in name or name.startswith('usb'):
+                    continue
+                try:
+                    dev_vendor = _read_sysfs(f'{entry.path}/idVendor')
+                    dev_product = _read_sysfs(f'{entry.path}/idProduct')
+                except OSError:
+                    continue
+                if (dev_vendor, dev_product) in KNOWN_MODEM_IDS:
+                    vendor_product = f"{dev_vendor.decode()}:{dev_product.decode()}"
+                    logger.info("Found modem with ID: %s at %s", vendor_product, name)
+                    return vendor_product
+        except OSError as e:
+            logger.error(f"Error scanning USB devices: {e}")
+        return None
+
+    def _resolve_modem(self):
+        """Return the cached (vendor_product, device_path, auth_fd) tuple,
+        running full USB discovery only on the first call."""
+        if self._usb_cache is not None:
+            return self._usb_cache
+
+        vendor_product = self._find_modem_id_via_sysfs()
+        if not vendor_product:
+            return None
+
+        device_path = self.find_usb_modem_path(vendor_product)
+        if not device_path:
+            return None
+
+        auth_file = f"{device_path}/authorized"
+        try:
+            auth_fd = os.open(auth_file, os.O_WRONLY)
+        except PermissionError:
+            logger.error(f"No write access to {auth_file} - run the service as root")
+            return None
+
+        self._usb_cache = (vendor_product, device_path, auth_fd)
+        return self._usb_cache
+
+    def _invalidate_usb_cache(self):
+        """Drop the cached modem path, e.g. after the device disappears"""
+        if self._usb_cache is not None:
+            auth_fd = self._usb_cache[2]
+            if auth_fd is not None:
+                try:
+                    os.close(auth_fd)
+                except OSError:
+                    pass
+            self._usb_cache = None
+
+    def _netlink_get_ipv4(self, interface: str) -> str:
+        """Get the interface's IPv4 address with a raw RTM_GETADDR dump.
+
+        getifaddrs walks and allocates entries for every interface; this
+        asks rtnetlink for IPv4 addresses and unpacks just the ifindex
+        and IFA_LOCAL fields we need, over a request/response socket held
+        for the service lifetime."""
+        try:
+            ifindex = socket.if_nametoindex(interface)
+        except OSError:
+            return None
+        with self._nl_lock:
+            try:
+                if self._nl_sock is None:
+                    self._nl_sock = socket.socket(
+                        socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE
+                    )
+                    self._nl_sock.bind((0, 0))
+                    self._nl_sock.settimeout(1)
+                sock = self._nl_sock
+                self._nl_seq += 1
+                seq = self._nl_seq
+                req = struct.pack(
+                    '=IHHII', NLMSG_HDR_LEN + IFADDRMSG_LEN, RTM_GETADDR,
+                    NLM_F_REQUEST | NLM_F_DUMP, seq, 0
+                )
+                req += struct.pack('=BBBBI', socket.AF_INET, 0, 0, 0, 0)
+                sock.send(req)
+
+                # Drain the whole dump (stale-seq messages from an earlier
+                # aborted dump are skipped) and return on our DONE marker
+                found = None
+                while True:
+                    data = sock.recv(65535)
+                    offset = 0
+                    while offset + NLMSG_HDR_LEN <= len(data):
+                        msg_len, msg_type, _, msg_seq, _ = struct.unpack_from(
+                            '=IHHII', data, offset)
+                        if msg_len < NLMSG_HDR_LEN:
+                            return found
+                        if msg_seq == seq:
+                            if msg_type == NLMSG_DONE:
+                                return found
+                            if msg_type == RTM_NEWADDR and found is None:
+                                family, _, _, _, index = struct.unpack_from(
+                                    '=BBBBI', data, offset + NLMSG_HDR_LEN)
+                                if family == socket.AF_INET and index == ifindex:
+                                    found = self._parse_ifa_local(
+                                        data, offset + NLMSG_HDR_LEN + IFADDRMSG_LEN,
+                                        offset + msg_len)
+                        offset += (msg_len + 3) & ~3
+            except OSError as e:
+                logger.debug("Netlink address dump failed: %s", e)
+                if self._nl_sock is not None:
+                    try:
+                        self._nl_sock.close()
+                    except OSError:
+                        pass
+                    self._nl_sock = None
+                return None
+
+    @staticmethod
+    def _parse_ifa_local(data: bytes, attr_off: int, end: int) -> str:
+        """Pull IFA_LOCAL out of an RTM_NEWADDR attribute list"""
+        while attr_off + 4 <= end:
+            attr_len, attr_type = struct.unpack_from('=HH', data, attr_off)
+            if attr_len < 4:
+                break
+            if attr_type == IFA_LOCAL and attr_len >= 8:
+                ip = socket.inet_ntoa(data[attr_off + 4:attr_off + 8])
+                if not ip.startswith('127.'):
+                    return ip
+            attr_off += (attr_len + 3) & ~3
+        return None
+
+    def close(self):
+        """Release kernel handles held for the service lifetime: the
+        authorized fd and the RTM_GETADDR request/response socket.
+
+        The rotate wait's multicast netlink socket is not among them on
+        purpose - it is opened per rotation, since one kept subscribed
+        between rotations would queue every link/address event in the
+        kernel with nobody reading them."""
+        self._invalidate_usb_cache()
+        with self._nl_lock:
+            if self._nl_sock is not None:
+                try:
+                    self._nl_sock.close()
+                except OSError:
+                    pass
+                self._nl_sock = None
+
+    def _invalidate_status_cache(self):
+        """Drop memoized status/probe results after the modem is toggled,
+        so the next status check reflects the new state immediately"""
+        self._status_cache_at = 0.0
+        self._probe_cache = (0.0, False)
+
+    def _set_authorized(self, value: bytes) -> bool:
+        """Write 0/1 to the modem's authorized file via the cached fd"""
+        for attempt in range(2):
+            resolved = self._resolve_modem()
+            if not resolved:
+                return False
+            vendor_product, device_path, auth_fd = resolved
+            try:
+                os.pwrite(auth_fd, value, 0)
+                return True
+            except OSError as e:
+                if e.errno in (errno.ENODEV, errno.ENOENT, errno.EBADF):
+                    # Device re-enumerated at a different address; rescan once
+                    logger.warning("Cached USB device path stale (%s), rescanning...", e)
+                    self._invalidate_usb_cache()
+                    continue
+                logger.error(f"USB authorized write failed: {e}")
+                return False
+        return False
+
+    # Common modem bus addresses, checked before the full scan
+    likely_devices = ['1-1.2', '1-1', '2-1']
+
+    def _candidate_devices(self):
+        """Yield candidate USB device names: likely addresses first, then a
+        full scan of /sys/bus/usb/devices (skipping interfaces and hubs)"""
+        yield from self.likely_devices
+        try:
+            for entry in os.scandir('/sys/bus/usb/devices'):
+                name = entry.name
+                if ':' in name or name.startswith('usb') or name in self.likely_devices:
+                    continue
+                yield name
+        except OSError as e:
+            logger.debug("Error scanning USB devices: %s", e)
+
     def find_usb_modem_path(self, vendor_product: str) -> str:
         """Find the USB device path for the modem in sysfs"""
         try:
             vendor_id, product_id = vendor_product.split(':')
-            logger.info(f"Searching for USB device with vendor:{vendor_id} product:{product_id}")
-            
-            # Method 1: Direct check of the likely device paths first
-            # Based on the debug output, the modem is likely at 1-1.2
-            likely_devices = ['1-1.2', '1-1', '2-1']  # Common modem locations
-            
-            for device_name in likely_devices:
+            # Sysfs attributes are compared as bytes; encode the target once
+            vendor_id_b = vendor_id.encode()
+            product_id_b = product_id.encode()
+            logger.info("Searching for USB device with vendor:%s product:%s", vendor_id, product_id)
+
+            for device_name in self._candidate_devices():
                 device_path = f"/sys/bus/usb/devices/{device_name}"
-                vendor_file = f"{device_path}/idVendor"
-                product_file = f"{device_path}/idProduct"
-                auth_file = f"{device_path}/authorized"
-                
                 try:
-                    if os.path.exists(vendor_file) and os.path.exists(product_file):
-                        with open(vendor_file, 'r') as f:
-                            dev_vendor = f.read().strip()
-                        with open(product_file, 'r') as f:
-                            dev_product = f.read().strip()
-                        
-                        logger.info(f"Checking device {device_name}: vendor={dev_vendor} product={dev_product}")
-                        
-                        if dev_vendor == vendor_id and dev_product == product_id:
-                            if os.path.exists(auth_file):
-                                logger.info(f"Found modem device at: {device_path}")
-                                logger.info(f"Authorized file found: {auth_file}")
-                                return device_path
-                            else:
-                                logger.warning(f"Device found but no authorized file: {auth_file}")
-                except Exception as e:
-                    logger.debug(f"Error checking device {device_name}: {e}")
+                    dev_vendor = _read_sysfs(f"{device_path}/idVendor")
+                    if dev_vendor != vendor_id_b:
+                        continue
+                    dev_product = _read_sysfs(f"{device_path}/idProduct")
+                except OSError:
                     continue
-            
-            # Method 2: Search by vendor/product ID in sysfs (fallback)
-            find_result = subprocess.run(
-                ['find', '/sys/bus/usb/devices', '-name', 'idVendor'], 
-                capture_output=True, text=True, timeout=10
-            )
-            
-            logger.info(f"Find command found {len(find_result.stdout.strip().split())} vendor files")
-            
-            for vendor_file in find_result.stdout.strip().split('\n'):
-                if not vendor_file:
-                    continue
-                try:
-                    with open(vendor_file, 'r') as f:
-                        file_vendor = f.read().strip()
-                    if file_vendor == vendor_id:
-                        # Check product ID too
-                        product_file = vendor_file.replace('idVendor', 'idProduct')
-                        with open(product_file, 'r') as f:
-                            file_product = f.read().strip()
-                        logger.info(f"Found matching vendor in {vendor_file}: vendor={file_vendor} product={file_product}")
-                        if file_product == product_id:
-                            usb_device_path = os.path.dirname(vendor_file)
-                            logger.info(f"Found USB device at: {usb_device_path}")
-                            
-                            # Verify the authorized file exists and is writable
-                            auth_file = f"{usb_device_path}/authorized"
-                            if os.path.exists(auth_file):
-                                logger.info(f"Authorized file found: {auth_file}")
-                                return usb_device_path
-                            else:
-                                logger.warning(f"Authorized file not found: {auth_file}")
-                                # Try to find parent device if this is an interface
-                                parent_path = os.path.dirname(usb_device_path)
-                                parent_auth = f"{parent_path}/authorized"
-                                if os.path.exists(parent_auth):
-                                    logger.info(f"Found parent device authorized file: {parent_auth}")
-                                    return parent_path
-                except Exception as e:
-                    logger.debug(f"Error checking USB device {vendor_file}: {e}")
+                logger.info("Checking device %s: vendor=%s product=%s",
+                            device_name, dev_vendor.decode(), dev_product.decode())
+                if dev_product != product_id_b:
                     continue
-            
-            # Method 3: Look for devices that match the pattern from debug listing
-            try:
-                ls_result = subprocess.run(
-                    ['ls', '-la', '/sys/bus/usb/devices/'], 
-                    capture_output=True, text=True, timeout=5
-                )
-                logger.info("Debug: Available USB devices in /sys/bus/usb/devices:")
-                logger.info(f"USB devices listing:\n{ls_result.stdout}")
-                
-                # Look for device entries that could be the modem (non-interface entries)
-                for line in ls_result.stdout.split('\n'):
-                    if '->' in line and ':' not in line:
-                        # This is a device, not an interface (no colon)
-                        parts = line.split()
-                        if len(parts) >= 9:
-                            device_name = parts[8]  # Get the symlink name
-                            if device_name not in ['usb1', 'usb2', '.', '..'] and device_name.startswith('1-'):
-                                device_path = f"/sys/bus/usb/devices/{device_name}"
-                                vendor_file = f"{device_path}/idVendor"
-                                product_file = f"{device_path}/idProduct"
-                                auth_file = f"{device_path}/authorized"
-                                
-                                logger.info(f"Scanning device: {device_name}")
-                                try:
-                                    if os.path.exists(vendor_file) and os.path.exists(product_file):
-                                        with open(vendor_file, 'r') as f:
-                                            dev_vendor = f.read().strip()
-                                        with open(product_file, 'r') as f:
-                                            dev_product = f.read().strip()
-                                        logger.info(f"Device {device_name}: vendor={dev_vendor} product={dev_product}")
-                                        if dev_vendor == vendor_id and dev_product == product_id:
-                                            if os.path.exists(auth_file):
-                                                logger.info(f"Found modem device by scanning: {device_path}")
-                                                return device_path
-                                            else:
-                                                logger.warning(f"Found modem but no authorized file: {auth_file}")
-                                except Exception as e:
-                                    logger.debug(f"Error scanning device {device_name}: {e}")
-                                    continue
-            except Exception as e:
-                logger.debug(f"Error in device scanning: {e}")
-                pass
-                
+                if os.path.exists(f"{device_path}/authorized"):
+                    logger.info("Found modem device at: %s", device_path)
+                    return device_path
+                logger.warning("Found modem but no authorized file: %s/authorized", device_path)
+
             return None
         except Exception as e:
             logger.error(f"Error finding USB device path: {e}")
             return None
         
-    def get_connection_status(self) -> Dict[str, Any]:
-        """Get current connection status"""
+    def get_connection_status(self, fresh: bool = False) -> Dict[str, Any]:
+        """Get current connection status.
+
+        Snapshots are memoized for status_ttl seconds so back-to-back
+        callers (e.g. the rotate wait loop) share one set of probes; pass
+        fresh=True to force new ones."""
+        if (not fresh and self._status_cache is not None
+                and time.monotonic() - self._status_cache_at < CFG.status_ttl):
+            return self._status_cache
         try:
             # For NetworkManager devices like cdc-wdm0, check the actual network interface (wwan0)
             network_interface = "wwan0"  # Always check wwan0 for IP status
             
             # Check if interface is up
-            result = subprocess.run(
-                ['ip', 'link', 'show', network_interface], 
-                capture_output=True, text=True, timeout=10
-            )
-            interface_up = result.returncode == 0 and 'UP' in result.stdout
-            
+            interface_up = interface_is_up(network_interface)
+
             # Get IP address if interface is up
             ip_address = None
             if interface_up:
-                ip_result = subprocess.run(
-                    ['ip', 'addr', 'show', network_interface], 
-                    capture_output=True, text=True, timeout=10
-                )
-                if ip_result.returncode == 0:
-                    lines = ip_result.stdout.split('\n')
-                    for line in lines:
-                        if 'inet ' in line and not 'inet 127.' in line:
-                            ip_address = line.strip().split()[1].split('/')[0]
-                            break
+                ip_address = self._netlink_get_ipv4(network_interface)
+                if ip_address is None and self._nl_sock is None:
+                    # Netlink path unavailable; fall back to getifaddrs
+                    ip_address = get_ipv4_address(network_interface)
             
             # Test internet connectivity
-            internet_connected = False
-            try:
-                ping_result = subprocess.run(
-                    ['ping', '-c', '1', '-W', '3', '8.8.8.8'], 
-                    capture_output=True, timeout=5
-                )
-                internet_connected = ping_result.returncode == 0
-            except:
-                pass
-                
-            return {
+            internet_connected = self._probe_internet(fresh)
+
+
+            status = {
                 "interface": network_interface,  # Show wwan0 in status
-                "nm_device": CONFIG["interface"],  # Show cdc-wdm0 as the control device
+                "nm_device": CFG.interface,  # Show cdc-wdm0 as the control device
                 "interface_up": interface_up,
                 "ip_address": ip_address,
                 "internet_connected": internet_connected,
                 "last_rotation": self.last_rotation,
                 "rotation_count": self.rotation_count
             }
+            self._status_cache = status
+            self._status_cache_at = time.monotonic()
+            return status
         except Exception as e:
             logger.error(f"Error getting connection status: {e}")
             return {"error": str(e)}
     
+    def _rfkill(self, action: str) -> bool:
+        """Block/unblock the cellular radio via rfkill (fallback path)"""
+        argv = ['/usr/sbin/rfkill', action, 'wwan']
+        if os.geteuid() != 0:
+            # Unprivileged manual runs keep a working rotation path via sudo
+            argv = ['/usr/bin/sudo'] + argv
+        # stdout is never read on success; only decode stderr on failure
+        result = _run(
+            argv, 10, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+        if result.returncode == 0:
+            logger.info(f"Cellular radio {action}ed via rfkill")
+            return True
+        logger.error("rfkill %s failed: %s", action,
+                     result.stderr.decode('utf-8', 'replace').strip())
+        return False
+
+    def _wait_for_enumeration(self, timeout: float) -> bool:
+        """Wait for the modem's network interface node to come back after
+        power-up. Writing 1 to authorized re-configures the device and
+        recreates wwan0; polling for that beats sleeping the worst case
+        when the modem enumerates quickly."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if os.path.exists('/sys/class/net/wwan0'):
+                return True
+            time.sleep(0.2)
+        return False
+
     def disconnect_modem(self) -> bool:
         """USB power cycle - nuclear option"""
         try:
             logger.info("Power cycling USB modem (nuclear option)...")
-            
-            # Step 1: Find the USB modem device
-            try:
-                result = subprocess.run(
-                    ['lsusb'], capture_output=True, text=True, timeout=10
-                )
-                usb_info = None
-                vendor_product = None
-                
-                for line in result.stdout.split('\n'):
-                    line_upper = line.upper()
-                    if ('SIMCOM' in line_upper or 'SIM7600' in line_upper or 
-                        'QUALCOMM' in line_upper or 'SIMTECH' in line_upper or
-                        'OPTION' in line_upper):
-                        # Extract vendor:product ID
-                        # Format: Bus 001 Device 004: ID 1e0e:9001 Qualcomm / Option SimTech
-                        if ' ID ' in line:
-                            id_part = line.split(' ID ')[1].split()[0]  # Get "1e0e:9001"
-                            vendor_product = id_part
-                            logger.info(f"Found modem with ID: {vendor_product} - {line.strip()}")
-                            break
-                
-                if not vendor_product:
-                    logger.warning("Could not find USB modem, falling back to rfkill")
-                    # Fallback to rfkill
-                    result = subprocess.run(
-                        ['sudo', 'rfkill', 'block', 'wwan'], 
-                        capture_output=True, text=True, timeout=10
-                    )
-                    if result.returncode == 0:
-                        logger.info("Cellular radio blocked via rfkill")
-                        return True
-                    else:
-                        return False
-                
-                # Find the USB device path
-                usb_info = self.find_usb_modem_path(vendor_product)
-                
-                if not usb_info:
-                    logger.warning("Could not find USB modem device path, falling back to rfkill")
-                    # Fallback to rfkill
-                    result = subprocess.run(
-                        ['sudo', 'rfkill', 'block', 'wwan'], 
-                        capture_output=True, text=True, timeout=10
-                    )
-                    if result.returncode == 0:
-                        logger.info("Cellular radio blocked via rfkill")
-                        return True
-                    else:
-                        return False
-                
-                # Step 2: Disable USB device
-                auth_file = f"{usb_info}/authorized"
-                
-                result = subprocess.run(
-                    ['sudo', 'sh', '-c', f'echo 0 > {auth_file}'], 
-                    capture_output=True, text=True, timeout=5
-                )
-                if result.returncode == 0:
-                    logger.info("USB modem powered down successfully")
-                    return True
-                else:
-                    logger.error(f"USB power down failed: {result.stderr}")
-                    return False
-                    
-            except Exception as e:
-                logger.error(f"USB detection failed: {e}")
-                return False
-                
+
+            if self._set_authorized(b'0'):
+                logger.info("USB modem powered down successfully")
+                self._invalidate_status_cache()
+                return True
+
+            logger.warning("Could not find USB modem, falling back to rfkill")
+            if self._rfkill('block'):
+                self._invalidate_status_cache()
+                return True
+            return False
+
         except Exception as e:
             logger.error(f"Error power cycling USB: {e}")
             return False
-    
+
     def connect_modem(self) -> bool:
         """Power up USB modem - nuclear option"""
         try:
             logger.info("Powering up USB modem...")
-            
-            # Step 1: Find the USB modem device (same logic as disconnect)
-            try:
-                result = subprocess.run(
-                    ['lsusb'], capture_output=True, text=True, timeout=10
-                )
-                usb_info = None
-                vendor_product = None
-                
-                for line in result.stdout.split('\n'):
-                    line_upper = line.upper()
-                    if ('SIMCOM' in line_upper or 'SIM7600' in line_upper or 
-                        'QUALCOMM' in line_upper or 'SIMTECH' in line_upper or
-                        'OPTION' in line_upper):
-                        # Extract vendor:product ID
-                        if ' ID ' in line:
-                            id_part = line.split(' ID ')[1].split()[0]  # Get "1e0e:9001"
-                            vendor_product = id_part
-                            logger.info(f"Found modem with ID: {vendor_product} - {line.strip()}")
-                            break
-                
-                if not vendor_product:
-                    logger.warning("Could not find USB modem, falling back to rfkill")
-                    # Fallback to rfkill
-                    result = subprocess.run(
-                        ['sudo', 'rfkill', 'unblock', 'wwan'], 
-                        capture_output=True, text=True, timeout=10
-                    )
-                    if result.returncode == 0:
-                        logger.info("Cellular radio unblocked via rfkill")
-                        time.sleep(8)
-                        return True
-                    else:
-                        return False
-                
-                # Find the USB device path
-                usb_info = self.find_usb_modem_path(vendor_product)
-                
-                if not usb_info:
-                    logger.warning("Could not find USB modem device path, falling back to rfkill")
-                    # Fallback to rfkill
-                    result = subprocess.run(
-                        ['sudo', 'rfkill', 'unblock', 'wwan'], 
-                        capture_output=True, text=True, timeout=10
-                    )
-                    if result.returncode == 0:
-                        logger.info("Cellular radio unblocked via rfkill")
-                        time.sleep(8)
-                        return True
-                    else:
-                        return False
-                
-                # Step 2: Re-enable USB device
-                auth_file = f"{usb_info}/authorized"
-                
-                result = subprocess.run(
-                    ['sudo', 'sh', '-c', f'echo 1 > {auth_file}'], 
-                    capture_output=True, text=True, timeout=5
-                )
-                if result.returncode == 0:
-                    logger.info("USB modem powered up successfully")
-                    
-                    # Wait for USB re-enumeration and auto-connect
-                    logger.info("Waiting for USB re-enumeration and auto-connect...")
-                    time.sleep(10)
-                    return True
-                else:
-                    logger.error(f"USB power up failed: {result.stderr}")
-                    return False
-                    
-            except Exception as e:
-                logger.error(f"USB re-enablement failed: {e}")
-                return False
-                
+
+            if self._set_authorized(b'1'):
+                logger.info("USB modem powered up successfully")
+                self._invalidate_status_cache()
+
+                # Wait for USB re-enumeration and auto-connect
+                logger.info("Waiting for USB re-enumeration and auto-connect...")
+                if not self._wait_for_enumeration(10):
+                    logger.warning("Interface did not reappear within 10s of power-up")
+                return True
+
+            logger.warning("Could not find USB modem, falling back to rfkill")
+            if self._rfkill('unblock'):
+                self._invalidate_status_cache()
+                self._wait_for_enumeration(8)
+                return True
+            return False
+
         except Exception as e:
             logger.error(f"Error powering up USB: {e}")
             return False
     
+    @staticmethod
+    def _netlink_has_event(data: bytes) -> bool:
+        """Check a netlink datagram for link/address change messages"""
+        offset = 0
+        while offset + NLMSG_HDR_LEN <= len(data):
+            msg_len, msg_type = struct.unpack_from('=IH', data, offset)
+            if msg_len < NLMSG_HDR_LEN:
+                break
+            if msg_type in (RTM_NEWLINK, RTM_NEWADDR, RTM_NEWROUTE):
+                return True
+            offset += (msg_len + 3) & ~3
+        return False
+
+    def _wait_for_connection_poll(self, timeout: float) -> bool:
+        """Fallback wait: inotify watch on /sys/class/net so the interface
+        reappearing wakes us up, degrading to a plain 1s sleep if the watch
+        can't be armed. sysfs only generates reliable inotify events for
+        node create/delete, so wakeups are bounded and re-check the full
+        status; the bound starts at 50 ms and backs off to 500 ms so a
+        fast reconnect is noticed early without probing harder on the
+        slow path."""
+        deadline = time.monotonic() + timeout
+        fd = _libc.inotify_init1(os.O_CLOEXEC)
+        wd = -1
+        if fd >= 0:
+            wd = _libc.inotify_add_watch(
+                fd, b'/sys/class/net', IN_CREATE | IN_MODIFY | IN_ATTRIB
+            )
+        interval = 0.05
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                if fd >= 0 and wd >= 0:
+                    ready, _, _ = select.select([fd], [], [], min(remaining, interval))
+                    if ready:
+                        os.read(fd, 4096)  # drain events
+                else:
+                    time.sleep(min(remaining, interval))
+                status = self.get_connection_status()
+                if status.get("internet_connected"):
+                    return True
+                interval = min(interval * 2, 0.5)
+        finally:
+            if fd >= 0:
+                os.close(fd)
+
+    def _wait_for_connection(self, timeout: float) -> bool:
+        """Wait for the connection to come back after a power cycle.
+
+        Blocks on an rtnetlink socket subscribed to link/address/route
+        events so we wake the moment the kernel publishes the interface
+        change. Connectivity can also appear without a subscribed event
+        landing (e.g. a probe that only starts succeeding after route
+        setup), so select wakeups are capped with the same 50 ms -> 500 ms
+        backoff as the poll fallback and timeout wakeups re-check too."""
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+            sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE))
+        except OSError as e:
+            logger.warning(f"Netlink unavailable ({e}), falling back to polling")
+            return self._wait_for_connection_poll(timeout)
+
+        deadline = time.monotonic() + timeout
+        interval = 0.05
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                ready, _, _ = select.select([sock], [], [], min(remaining, interval))
+                if ready:
+                    data = sock.recv(65535)
+                    # A kernel event is the strongest signal; probe for real
+                    if self._netlink_has_event(data):
+                        status = self.get_connection_status(fresh=True)
+                        if status.get("internet_connected"):
+                            return True
+                else:
+                    status = self.get_connection_status()
+                    if status.get("internet_connected"):
+                        return True
+                    interval = min(interval * 2, 0.5)
+        finally:
+            sock.close()
+
     def rotate_connection(self) -> Dict[str, Any]:
         """Rotate the modem connection"""
         with self.lock:
@@ -393,7 +705,7 @@ class ModemRotator:
                 logger.info("Starting connection rotation...")
                 
                 # Get initial status
-                initial_status = self.get_connection_status()
+                initial_status = self.get_connection_status(fresh=True)
                 
                 # Disconnect
                 if not self.disconnect_modem():
@@ -404,13 +716,13 @@ class ModemRotator:
                     }
                 
                 # Wait before reconnecting (longer delay for aggressive rotation)
-                if CONFIG.get("aggressive_rotation", False):
-                    delay = CONFIG.get("modem_reset_delay", 10)
+                if CFG.aggressive_rotation:
+                    delay = CFG.modem_reset_delay
                     logger.info(f"Aggressive rotation: waiting {delay} seconds for complete session reset...")
                     time.sleep(delay)
                 else:
-                    logger.info(f"Waiting {CONFIG['disconnect_delay']} seconds...")
-                    time.sleep(CONFIG["disconnect_delay"])
+                    logger.info(f"Waiting {CFG.disconnect_delay} seconds...")
+                    time.sleep(CFG.disconnect_delay)
                 
                 # Reconnect
                 if not self.connect_modem():
@@ -422,18 +734,13 @@ class ModemRotator:
                 
                 # Wait for connection to establish
                 logger.info("Waiting for connection to establish...")
-                start_time = time.time()
-                while time.time() - start_time < CONFIG["reconnect_timeout"]:
-                    time.sleep(1)  # Check every 1 second instead of 2
-                    status = self.get_connection_status()
-                    if status.get("internet_connected"):
-                        break
+                self._wait_for_connection(CFG.reconnect_timeout)
                 
                 # Update tracking
-                self.last_rotation = datetime.now().isoformat()
+                self.last_rotation = isoformat_now()
                 self.rotation_count += 1
                 
-                final_status = self.get_connection_status()
+                final_status = self.get_connection_status(fresh=True)
                 logger.info("Connection rotation completed")
                 
                 return {
@@ -453,63 +760,63 @@ class ModemRotator:
                     "status": self.get_connection_status()
                 }
 
+# Pre-encoded body for '/' - the service info never changes at runtime
+_ROOT_JSON = json.dumps({
+    "service": "Modem Connection Rotator",
+    "version": "1.0",
+    "endpoints": {
+        "/status": "Get connection status",
+        "/rotate": "Rotate connection",
+        "/health": "Health check"
+    }
+}, separators=(',', ':')).encode()
+
+# Fully and partially constant bodies for the other fixed-shape responses
+_NOT_FOUND_JSON = b'{"error":"Endpoint not found"}'
+_HEALTH_PREFIX = b'{"status":"healthy","timestamp":"'
+
+def _encode_json(obj) -> bytes:
+    """Compact-encode a response body (clients don't need pretty-printing)"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode()
+
 class RotatorHandler(BaseHTTPRequestHandler):
     def __init__(self, *args, rotator=None, **kwargs):
         self.rotator = rotator
         super().__init__(*args, **kwargs)
     
+    def _send_json(self, code: int, body: bytes):
+        """Send a JSON response with the standard headers"""
+        self.send_response(code)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
     def do_GET(self):
         """Handle GET requests"""
         if self.path == '/':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            response = {
-                "service": "Modem Connection Rotator",
-                "version": "1.0",
-                "endpoints": {
-                    "/status": "Get connection status",
-                    "/rotate": "Rotate connection",
-                    "/health": "Health check"
-                }
-            }
-            self.wfile.write(json.dumps(response, indent=2).encode())
-            
+            self._send_json(200, _ROOT_JSON)
+
         elif self.path == '/status':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            status = self.rotator.get_connection_status()
-            self.wfile.write(json.dumps(status, indent=2).encode())
-            
+            self._send_json(200, _encode_json(self.rotator.get_connection_status()))
+
         elif self.path == '/health':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            response = {"status": "healthy", "timestamp": datetime.now().isoformat()}
-            self.wfile.write(json.dumps(response, indent=2).encode())
-            
+            # Constant apart from the (second-cached) timestamp splice
+            body = _HEALTH_PREFIX + isoformat_now().encode() + b'"}'
+            self._send_json(200, body)
+
         else:
-            self.send_response(404)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            response = {"error": "Endpoint not found"}
-            self.wfile.write(json.dumps(response).encode())
+            self._send_json(404, _NOT_FOUND_JSON)
     
     def do_POST(self):
         """Handle POST requests"""
         if self.path == '/rotate':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
             result = self.rotator.rotate_connection()
-            self.wfile.write(json.dumps(result, indent=2).encode())
+            self._send_json(200, _encode_json(result))
         else:
-            self.send_response(404)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            response = {"error": "Endpoint not found"}
-            self.wfile.write(json.dumps(response).encode())
+            self._send_json(404, _NOT_FOUND_JSON)
     
     def log_message(self, format, *args):
         """Override to use our logger"""
@@ -524,9 +831,12 @@ def main():
     rotator = ModemRotator()
     handler = create_handler(rotator)
     
-    server = HTTPServer(('0.0.0.0', CONFIG["port"]), handler)
-    logger.info(f"Starting Modem Rotator Service on port {CONFIG['port']}")
-    logger.info(f"Interface: {CONFIG['interface']}")
+    # ThreadingHTTPServer so /status and /health keep responding while a
+    # /rotate holds the rotation lock for tens of seconds. daemon_threads
+    # is on by default, so Ctrl-C doesn't wait on in-flight handlers.
+    server = ThreadingHTTPServer(('0.0.0.0', CFG.port), handler)
+    logger.info(f"Starting Modem Rotator Service on port {CFG.port}")
+    logger.info(f"Interface: {CFG.interface}")
     logger.info("Endpoints:")
     logger.info("  GET  /         - Service info")
     logger.info("  GET  /status   - Connection status")
@@ -538,6 +848,8 @@ def main():
     except KeyboardInterrupt:
         logger.info("Shutting down server...")
         server.shutdown()
+        rotator.close()
+        _stop_log_listener()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
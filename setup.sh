@@ -26,21 +26,14 @@ chmod +x "$INSTALL_DIR/rotator.py"
 
 # Install systemd service
 echo "Installing systemd service..."
-# Create service file with current user and path
-sed -e "s|USER_PLACEHOLDER|$CURRENT_USER|g" \
-    -e "s|INSTALL_DIR_PLACEHOLDER|$INSTALL_DIR|g" \
+# Create service file with the install path (the service runs as root so
+# it can write the modem's sysfs authorized file directly)
+sed -e "s|INSTALL_DIR_PLACEHOLDER|$INSTALL_DIR|g" \
     rotator.service > /tmp/rotator.service
 sudo cp /tmp/rotator.service /etc/systemd/system/
 rm /tmp/rotator.service
 sudo systemctl daemon-reload
 
-# Add user to sudoers for network commands (if not already there)
-CURRENT_USER=$(whoami)
-echo "Configuring sudo permissions for network commands for user: $CURRENT_USER"
-if ! sudo grep -q "$CURRENT_USER.*NOPASSWD.*ip\|nmcli\|dhclient\|killall" /etc/sudoers; then
-    echo "$CURRENT_USER ALL=(ALL) NOPASSWD: /sbin/ip, /usr/bin/nmcli, /sbin/dhclient, /usr/bin/killall" | sudo tee -a /etc/sudoers
-fi
-
 # Enable and start service
 echo "Enabling and starting service..."
 sudo systemctl enable rotator.service